@@ -1,19 +1,17 @@
 import streamlit as st
-from modules.model import load_model, SENSITIVITY_LEVELS
+from modules.model import load_model, predict_entities_cached, SENSITIVITY_LEVELS
 from modules.redaction import redact_text, extract_text_from_file, redact_file_content, convert_to_original_format
 from typing import List, Dict, Optional, Tuple
+from itertools import zip_longest
 
 st.set_page_config(page_title="EDR Tool", layout="wide")
 
-# Cache the model loading
+# Cache the model loading; loaded on the first redaction rather than at startup
 @st.cache_resource
 def get_model():
     """Load and cache the model for entity detection."""
     return load_model()
 
-# Load model once at startup
-model = get_model()
-
 # Set fixed confidence threshold
 CONFIDENCE_THRESHOLD = 0.1
 
@@ -71,7 +69,7 @@ def render_sidebar() -> str:
         # Sensitivity Level Selection
         sensitivity = st.selectbox(
             "Select Sensitivity Level",
-            ["Low", "Medium", "High"],
+            list(SENSITIVITY_LEVELS),
             help="Choose the level of Privileged Information detection sensitivity"
         )
         st.subheader("Detected Privileged Information Types")
@@ -90,25 +88,25 @@ def clean_text_for_display(text: str) -> str:
     Returns:
         str: The cleaned text with markdown tables converted to plain text.
     """
+    if '|' not in text:
+        # No table markup: only trailing empty lines need removing
+        return text.rstrip('\n')
+
     lines = text.split('\n')
     cleaned_lines = []
     in_table = False
     table_lines = []
     
     for line in lines:
-        if line.strip().startswith('|') and line.strip().endswith('|'):
+        stripped = line.strip()
+        if stripped.startswith('|') and stripped.endswith('|'):
             in_table = True
-            if not line.strip().startswith('| ---'):
-                cells = [cell.strip() for cell in line.split('|')[1:-1]]
-                paired_cells = []
-                for i in range(0, len(cells), 2):
-                    left_cell = cells[i] if i < len(cells) else ''
-                    right_cell = cells[i + 1] if i + 1 < len(cells) else ''
+            if not stripped.startswith('| ---'):
+                cells = list(map(str.strip, stripped[1:-1].split('|')))
+                # Pair cells two per row; an odd trailing cell gets an empty partner
+                for left_cell, right_cell in zip_longest(cells[0::2], cells[1::2], fillvalue=''):
                     if left_cell or right_cell:
-                        left_cell_padded = left_cell.ljust(30)
-                        paired_cells.append(f"{left_cell_padded} {right_cell}")
-                if paired_cells:
-                    table_lines.extend(paired_cells)
+                        table_lines.append(f"{left_cell.ljust(30)} {right_cell}")
         else:
             if in_table:
                 # End of table, append the table lines and a single newline
@@ -174,12 +172,25 @@ def text_redaction_tab(sensitivity: str) -> None:
         help="Paste or type the text you want to analyze"
     )
     
+    text_redaction_action(input_text, sensitivity)
+
+@st.fragment
+def text_redaction_action(input_text: str, sensitivity: str) -> None:
+    """
+    Render the Redact Text button and its results as a fragment, so clicking it
+    reruns only this block instead of the whole page.
+
+    Args:
+        input_text (str): The text to redact.
+        sensitivity (str): The selected sensitivity level.
+    """
     if st.button("Redact Text", key="text_redact"):
         if input_text:
-            entities = model.predict_entities(
+            entities = predict_entities_cached(
+                get_model(),
                 input_text,
-                SENSITIVITY_LEVELS[sensitivity],
-                threshold=CONFIDENCE_THRESHOLD
+                sensitivity,
+                CONFIDENCE_THRESHOLD
             )
             redacted_text = redact_text(input_text, entities)
             display_results(input_text, redacted_text, entities, "text_")
@@ -212,7 +223,7 @@ def file_redaction_tab(sensitivity: str) -> None:
             try:
                 original_text, redacted_text, entities = redact_file_content(
                     uploaded_file,
-                    model,
+                    get_model(),
                     SENSITIVITY_LEVELS[sensitivity],
                     CONFIDENCE_THRESHOLD
                 )
@@ -1,7 +1,55 @@
+import functools
+import importlib.util
+import os
+import re
+import sys
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import streamlit as st
+import torch
 from gliner import GLiNER
 
-# Comprehensive list of Privileged Information labels
-ALL_LABELS = [
+try:
+    from gliner import InferencePackingConfig
+except ImportError:  # GLiNER releases without inference-time sequence packing
+    InferencePackingConfig = None
+
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+# GPU autocast precision: bfloat16 where supported (Ampere+), float16 Tensor Cores otherwise
+GPU_DTYPE = torch.bfloat16 if DEVICE == "cuda" and torch.cuda.is_bf16_supported() else torch.float16
+
+# FlashDeBERTa fuses the DeBERTa attention into a single kernel; it runs on GPU only
+USE_FLASHDEBERTA = DEVICE == "cuda" and importlib.util.find_spec("flashdeberta") is not None
+
+# Compile the encoder with torch.compile on GPU. CUDA graphs ("reduce-overhead") are not used:
+# their state is thread-local, and Streamlit runs every rerun on a new script thread.
+COMPILE_MODEL = DEVICE == "cuda"
+WARMUP_BATCH_SIZES = (1, 2, 4, 8)
+
+# CPU inference precision: "int8" (dynamic quantization of Linear layers) or
+# "bf16" (autocast, for CPUs with native BF16/AMX support).
+CPU_PRECISION = "int8"
+
+# Maximum words per chunk sent to the model; GLiNER truncates longer inputs
+MAX_CHUNK_WORDS = 200
+
+# Chunks per batched model call. Batches run one after another: GPU kernels serialize on the
+# device, and each CPU forward pass already uses all of torch's intra-op threads.
+PREDICT_BATCH_SIZE = 8
+
+# Number of (text, sensitivity, threshold) predictions kept in memory across reruns
+PREDICTION_CACHE_SIZE = 128
+
+# Packed sequence length when GLiNER inference packing is available
+PACKING_MAX_LENGTH = 512
+
+# Paragraphs are runs of text not separated by a blank line
+_PARAGRAPH_PATTERN = re.compile(r'(?:[^\n]|\n(?![ \t]*\n))+')
+_WORD_PATTERN = re.compile(r'\S+')
+
+# Comprehensive list of Privileged Information labels (interned, so every level shares the same objects)
+ALL_LABELS = tuple(map(sys.intern, (
     "person", "organization", "phone number", "address", "passport number",
     "email", "credit card number", "social security number", "health insurance id number",
     "date of birth", "mobile phone number", "bank account number", "medication", "cpf",
@@ -14,39 +62,227 @@ ALL_LABELS = [
     "credit card brand", "fax number", "visa number", "insurance company",
     "identity document number", "transaction number", "national health insurance number",
     "cvc", "birth certificate number", "train ticket number", "passport expiration date"
-]
+)))
+
+# Labels detected at Low sensitivity; each higher level adds to the one below
+_LOW_LABELS = tuple(dict.fromkeys(map(sys.intern, [
+    "person", "date of birth", "medical condition", "medication",
+    "organization", "address", "email", "phone number", "mobile phone number",
+    "landline phone number", "social media handle", "username",
+    "medical condition", "blood type", "reservation number",
+    "flight number", "train ticket number", "postal code",
+    "insurance company", "registration number", "student id number",
+    "vehicle registration number", "license plate number", "serial number",
+    "fax number", "ip address", "digital signature"
+])))
+
+_MEDIUM_LABELS = _LOW_LABELS + tuple(map(sys.intern, (
+    "social security number", "health insurance id number", "health insurance number",
+    "insurance number", "national health insurance number",
+    "tax identification number", "cpf", "cnpj",
+    "email address", "iban", "bank account number",
+    "driver's license number", "identity card number", "national id number",
+    "identity document number", "visa number"
+)))
 
-# Sensitivity levels configuration
+# Sensitivity levels configuration (immutable, duplicates dropped, order preserved)
 SENSITIVITY_LEVELS = {
-    "Low": [
-        "person", "date of birth", "medical condition", "medication",
-        "organization", "address", "email", "phone number", "mobile phone number",
-        "landline phone number", "social media handle", "username",
-        "medical condition", "blood type", "reservation number",
-        "flight number", "train ticket number", "postal code",
-        "insurance company", "registration number", "student id number",
-        "vehicle registration number", "license plate number", "serial number",
-        "fax number", "ip address", "digital signature"
-    ],
-    "Medium": [
-        "person", "date of birth", "medical condition", "medication",
-        "organization", "address", "email", "phone number", "mobile phone number",
-        "landline phone number", "social media handle", "username",
-        "medical condition", "blood type", "reservation number",
-        "flight number", "train ticket number", "postal code",
-        "insurance company", "registration number", "student id number",
-        "vehicle registration number", "license plate number", "serial number",
-        "fax number", "ip address", "digital signature",
-        "social security number", "health insurance id number", "health insurance number",
-        "insurance number", "national health insurance number",
-        "tax identification number", "cpf", "cnpj",
-        "email address", "iban", "bank account number",
-        "driver's license number", "identity card number", "national id number",
-        "identity document number", "visa number"
-    ],
+    "Low": _LOW_LABELS,
+    "Medium": _MEDIUM_LABELS,
     "High": ALL_LABELS
 }
 
 def load_model():
-    """Load and return the GLiNER model."""
-    return GLiNER.from_pretrained("mohanchandm/edr_v2")
+    """
+    Load the GLiNER model, enabling inference packing when supported. On GPU the
+    model is moved to CUDA with a compiled, warmed-up encoder (and FlashDeBERTa
+    attention when installed); on CPU its Linear layers are quantized to INT8 when
+    CPU_PRECISION is "int8".
+
+    Returns:
+        GLiNER: The loaded model in evaluation mode.
+    """
+    if USE_FLASHDEBERTA:
+        # GLiNER swaps in the FlashDeBERTa backbone when this flag is set at load time
+        os.environ.setdefault("USE_FLASHDEBERTA", "1")
+    model = GLiNER.from_pretrained("mohanchandm/edr_v2")
+    model.eval()
+    if InferencePackingConfig is not None and hasattr(model, "configure_inference_packing"):
+        # Pack short chunks into shared sequences (block-diagonal attention) instead of padding
+        model.configure_inference_packing(InferencePackingConfig(
+            max_length=PACKING_MAX_LENGTH,
+            sep_token_id=model.data_processor.transformer_tokenizer.sep_token_id
+        ))
+    if DEVICE == "cuda":
+        model.to(DEVICE)
+        if COMPILE_MODEL:
+            model.model = torch.compile(model.model, mode="max-autotune-no-cudagraphs")
+            warmup_model(model)
+    elif CPU_PRECISION == "int8":
+        if "x86" in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = "x86"
+        # Dynamic INT8 quantization of the encoder's dense layers (weights stored as int8,
+        # activations quantized on the fly), which halves weight traffic on the GEMM hot path.
+        model.model = torch.ao.quantization.quantize_dynamic(
+            model.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return model
+
+def warmup_model(model: GLiNER) -> None:
+    """
+    Run dummy batches through the model so compilation happens at load time.
+
+    Two chunk lengths are used so torch.compile marks the sequence dimension
+    dynamic and later inputs of other lengths reuse the compiled graph. Every
+    sensitivity level's label set is warmed up, since a differently sized label
+    dimension would otherwise recompile on the first real call.
+
+    Args:
+        model (GLiNER): The loaded model.
+    """
+    for labels in SENSITIVITY_LEVELS.values():
+        for num_words in (MAX_CHUNK_WORDS // 2, MAX_CHUNK_WORDS):
+            for batch_size in WARMUP_BATCH_SIZES:
+                batch_predict_entities(model, ["x " * num_words] * batch_size, labels, 0.5)
+
+@contextmanager
+def inference_context() -> Iterator[None]:
+    """Disable autograd and autocast matmuls to GPU_DTYPE on GPU, or to bfloat16 for BF16 CPU precision."""
+    with torch.inference_mode():
+        if DEVICE == "cuda":
+            with torch.autocast(device_type="cuda", dtype=GPU_DTYPE):
+                yield
+        elif CPU_PRECISION == "bf16":
+            with torch.autocast(device_type="cpu", dtype=torch.bfloat16):
+                yield
+        else:
+            yield
+
+@st.cache_resource(show_spinner=False)
+def get_label_embeddings(_model: GLiNER, labels: Sequence[str]) -> Optional[torch.Tensor]:
+    """
+    Encode and cache the label embeddings for a label set.
+
+    Only bi-encoder GLiNER models can encode labels independently of the text;
+    for other models this returns None and prediction falls back to the joint path.
+
+    Args:
+        _model (GLiNER): The loaded model (excluded from the cache key).
+        labels (Sequence[str]): The labels to encode.
+
+    Returns:
+        Optional[torch.Tensor]: The label embeddings, or None if unsupported.
+    """
+    if not getattr(_model.config, "labels_encoder", None) or not hasattr(_model, "encode_labels"):
+        return None
+    with inference_context():
+        return _model.encode_labels(list(labels))
+
+def batch_predict_entities(model: GLiNER, texts: List[str], labels: Sequence[str], threshold: float) -> List[List[Dict[str, any]]]:
+    """
+    Run entity prediction on several texts in a single batched call.
+
+    Args:
+        model (GLiNER): The loaded model.
+        texts (List[str]): The texts to analyze.
+        labels (Sequence[str]): The labels to detect.
+        threshold (float): The confidence threshold for entity detection.
+
+    Returns:
+        List[List[Dict[str, any]]]: The detected entities for each text.
+    """
+    return _batch_predict(model, texts, labels, threshold, get_label_embeddings(model, labels))
+
+def _batch_predict(model: GLiNER, texts: List[str], labels: Sequence[str], threshold: float,
+                   label_embeddings: Optional[torch.Tensor]) -> List[List[Dict[str, any]]]:
+    """Run one batched prediction; safe to call from worker threads (no Streamlit calls)."""
+    with inference_context():
+        if label_embeddings is not None:
+            return model.batch_predict_with_embeds(texts, label_embeddings, list(labels), threshold=threshold)
+        return model.batch_predict_entities(texts, list(labels), threshold=threshold)
+
+@functools.lru_cache(maxsize=PREDICTION_CACHE_SIZE)
+def predict_entities_cached(model: GLiNER, text: str, sensitivity: str, threshold: float) -> List[Dict[str, any]]:
+    """
+    Run chunked entity prediction for a sensitivity level, memoizing results across
+    Streamlit reruns.
+
+    The returned list is shared between calls and must not be mutated.
+
+    Args:
+        model (GLiNER): The loaded model.
+        text (str): The text to analyze.
+        sensitivity (str): The sensitivity level whose labels are detected.
+        threshold (float): The confidence threshold for entity detection.
+
+    Returns:
+        List[Dict[str, any]]: The detected entities.
+    """
+    return predict_document(model, text, SENSITIVITY_LEVELS[sensitivity], threshold)
+
+def split_into_chunks(text: str, max_words: int = MAX_CHUNK_WORDS) -> List[Tuple[int, str]]:
+    """
+    Split text into paragraph chunks of at most max_words words.
+
+    Args:
+        text (str): The text to split.
+        max_words (int): The maximum number of words per chunk.
+
+    Returns:
+        List[Tuple[int, str]]: The chunks with their start offsets in the original text.
+    """
+    chunks = []
+    for paragraph in _PARAGRAPH_PATTERN.finditer(text):
+        words = list(_WORD_PATTERN.finditer(text, paragraph.start(), paragraph.end()))
+        for i in range(0, len(words), max_words):
+            start = words[i].start()
+            end = words[min(i + max_words, len(words)) - 1].end()
+            chunks.append((start, text[start:end]))
+    return chunks
+
+def predict_documents(model: GLiNER, texts: List[str], labels: Sequence[str], threshold: float) -> List[List[Dict[str, any]]]:
+    """
+    Run entity prediction on several long texts, batching the chunks of all texts together.
+
+    Args:
+        model (GLiNER): The loaded model.
+        texts (List[str]): The texts to analyze.
+        labels (Sequence[str]): The labels to detect.
+        threshold (float): The confidence threshold for entity detection.
+
+    Returns:
+        List[List[Dict[str, any]]]: The detected entities for each text, with offsets into that text.
+    """
+    # Flatten the chunks of every text, remembering which text each chunk came from
+    chunks = [(text_index, offset, chunk)
+              for text_index, text in enumerate(texts)
+              for offset, chunk in split_into_chunks(text)]
+    entities_per_text = [[] for _ in texts]
+    if not chunks:
+        return entities_per_text
+    chunk_texts = [chunk for _, _, chunk in chunks]
+    batches = [chunk_texts[i:i + PREDICT_BATCH_SIZE] for i in range(0, len(chunk_texts), PREDICT_BATCH_SIZE)]
+    label_embeddings = get_label_embeddings(model, labels)
+    predictions = [entities for batch in batches
+                   for entities in _batch_predict(model, batch, labels, threshold, label_embeddings)]
+    for (text_index, offset, _), chunk_entities in zip(chunks, predictions):
+        for entity in chunk_entities:
+            entities_per_text[text_index].append(
+                {**entity, "start": entity["start"] + offset, "end": entity["end"] + offset}
+            )
+    return entities_per_text
+
+def predict_document(model: GLiNER, text: str, labels: Sequence[str], threshold: float) -> List[Dict[str, any]]:
+    """
+    Run entity prediction on a long text, split into batched chunks.
+
+    Args:
+        model (GLiNER): The loaded model.
+        text (str): The text to analyze.
+        labels (Sequence[str]): The labels to detect.
+        threshold (float): The confidence threshold for entity detection.
+
+    Returns:
+        List[Dict[str, any]]: The detected entities, with offsets into the full text.
+    """
+    return predict_documents(model, [text], labels, threshold)[0]
@@ -0,0 +1,53 @@
+from typing import List, Optional, Tuple
+import fitz  # PyMuPDF
+
+# Scanned PDF pages are rendered with the longer side near OCR_TARGET_PIXELS (capped at
+# OCR_MAX_DPI) as JPEG
+OCR_TARGET_PIXELS = 1024
+OCR_MAX_DPI = 300
+OCR_JPEG_QUALITY = 85
+
+def render_page_for_ocr(page: fitz.Page, dpi: Optional[int] = None) -> bytes:
+    """
+    Render a PDF page to JPEG for OCR.
+
+    Args:
+        page (fitz.Page): The page to render.
+        dpi (Optional[int]): The resolution; by default the longer side lands near
+            OCR_TARGET_PIXELS, capped at OCR_MAX_DPI.
+
+    Returns:
+        bytes: The JPEG image.
+    """
+    if dpi is None:
+        longest_side_inches = max(page.rect.width, page.rect.height) / 72
+        dpi = max(1, min(OCR_MAX_DPI, int(OCR_TARGET_PIXELS / longest_side_inches)))
+    pixmap = page.get_pixmap(dpi=dpi, alpha=False)
+    return pixmap.tobytes("jpeg", jpg_quality=OCR_JPEG_QUALITY)
+
+def extract_pdf_pages(pdf_bytes: bytes) -> List[Tuple[int, Optional[str], Optional[bytes]]]:
+    """
+    Extract text from every PDF page, rendering only scanned (image-bearing,
+    low-text) pages for OCR.
+
+    Args:
+        pdf_bytes (bytes): The PDF file contents.
+
+    Returns:
+        List[Tuple[int, Optional[str], Optional[bytes]]]: The page number, extracted text, and
+        JPEG rendering (only for pages that need OCR) for each page.
+    """
+    results = []
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+        for page_num, page in enumerate(pdf):
+            page_text = page.get_text("text")
+            # Text page: enough extracted text, no OCR needed
+            if len(page_text.strip()) >= 10:
+                results.append((page_num, page_text, None))
+            # Blank page: little or no text and no images, so OCR has nothing to read
+            elif not page.get_images(full=True):
+                results.append((page_num, page_text, None))
+            # Scanned page: render it for OCR
+            else:
+                results.append((page_num, None, render_page_for_ocr(page)))
+    return results
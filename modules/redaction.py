@@ -1,11 +1,13 @@
 from docx import Document
 import streamlit as st
-import pdfplumber
+import fitz  # PyMuPDF
 from io import BytesIO
 import docx2txt
 import re
 from mistralai import Mistral
+from mistralai.models import SDKError
 import base64
+import functools
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet
@@ -15,11 +17,61 @@ from docx.oxml.ns import qn
 from docx.shared import Inches
 from PIL import Image, ImageDraw, ImageFont
 import io
-from typing import List, Dict, Optional, Tuple
-
-# Mistral API key (load from Streamlit secrets)
-MISTRAL_API_KEY = st.secrets.get("mistral_api_key", "")  # Default to hardcoded if not in secrets
-mistral_client = Mistral(api_key=MISTRAL_API_KEY)
+import mimetypes
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Callable, List, Dict, Optional, Tuple
+from modules.model import ALL_LABELS, predict_documents
+from modules.pdf_extraction import OCR_MAX_DPI, extract_pdf_pages, render_page_for_ocr
+
+# Mistral OCR: concurrent requests, request rate (Mistral allows 6 req/s), per-request
+# timeout, and retry backoff; the limits are shared by every OCR batch in the process
+OCR_MODEL = "mistral-ocr-latest"
+OCR_MAX_CONCURRENCY = 6
+OCR_REQUESTS_PER_SECOND = 6
+OCR_TIMEOUT_MS = 60_000
+OCR_MAX_ATTEMPTS = 5
+OCR_BACKOFF_SECONDS = 1.0
+OCR_MAX_BACKOFF_SECONDS = 30.0
+_ocr_limits = None  # (asyncio.Semaphore, _RateLimiter), created on the OCR event loop
+
+# OCR results kept in memory, keyed by a hash of the OCR model and image content
+OCR_CACHE_SIZE = 256
+_ocr_cache = OrderedDict()
+_ocr_cache_lock = threading.Lock()
+
+# Scanned PDF pages whose OCR text is shorter than OCR_RETRY_MIN_CHARS are re-rendered once at OCR_MAX_DPI
+OCR_RETRY_MIN_CHARS = 50
+
+# OCR clean-up patterns, compiled once
+_RE_REPEATED_LETTER = re.compile(r'([a-zA-Z])\1{2,}')
+_RE_DATE_PLACEHOLDER = re.compile(r'\$(\d{4}-\d{2}-\d{2})\$')
+
+_get_start = itemgetter("start")
+
+# Redaction token for each known label, built once instead of per entity
+_REDACTION_TOKENS = {label: f"[REDACTED {label.upper()}]" for label in ALL_LABELS}
+
+# Shared ReportLab styles for markdown_to_pdf, built once
+_PDF_STYLES = getSampleStyleSheet()
+_PDF_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+])
 
 def redact_text(text: str, entities: List[Dict[str, any]]) -> str:
     """
@@ -32,23 +84,28 @@ def redact_text(text: str, entities: List[Dict[str, any]]) -> str:
     Returns:
         str: The redacted text.
     """
-    # Sort entities by start position and length (longer first to handle overlaps)
-    entities = sorted(entities, key=lambda x: (x["start"], -(x["end"] - x["start"])))
-    redacted_text = text
-    offset = 0  # Track offset due to redactions
+    if not entities:
+        return text
+    # Sort entities by start position; overlaps are resolved in the loop below
+    if len(entities) > 1:
+        entities = sorted(entities, key=_get_start)
+    parts = []
+    cursor = 0  # End of the text already emitted
 
     for entity in entities:
-        start, end = entity["start"] + offset, entity["end"] + offset
-        entity_text = redacted_text[start:end]
-        redacted_label = f"[REDACTED {entity['label'].upper()}]"
-        # Calculate padding to preserve length
-        padding = " " * max(0, len(entity_text) - len(redacted_label))
-        # Replace the entity text
-        redacted_text = redacted_text[:start] + redacted_label + padding + redacted_text[end:]
-        # Update offset based on length difference
-        offset += len(redacted_label + padding) - len(entity_text)
-
-    return redacted_text
+        start, end = entity["start"], entity["end"]
+        if end <= cursor:
+            continue  # Fully covered by a previous redaction
+        # Redact only the part not already covered by an overlapping entity
+        start = max(start, cursor)
+        redacted_label = _REDACTION_TOKENS.get(entity["label"]) or f"[REDACTED {entity['label'].upper()}]"
+        parts.append(text[cursor:start])
+        # Pad to preserve length when the label is shorter than the entity text
+        parts.append(redacted_label.ljust(end - start))
+        cursor = end
+
+    parts.append(text[cursor:])
+    return "".join(parts)
 
 def clean_ocr_text(text: str) -> str:
     """
@@ -61,105 +118,397 @@ def clean_ocr_text(text: str) -> str:
         str: The cleaned text.
     """
     # Fix repetitive character removal (e.g., "aaa" -> "a")
-    text = re.sub(r'([a-zA-Z])\1{2,}', r'\1', text)  # Only letters, 2+ repetitions
-    # Normalize spaces
-    text = re.sub(r'\s+', ' ', text)
+    text = _RE_REPEATED_LETTER.sub(r'\1', text)  # Only letters, 2+ repetitions
     # Fix date placeholders
-    text = re.sub(r'\$(\d{4}-\d{2}-\d{2})\$', r'\1', text)
-    # Collapse multiple newlines
-    text = re.sub(r'\n+', '\n', text)
-    return text.strip()
+    text = _RE_DATE_PLACEHOLDER.sub(r'\1', text)
+    # Collapse every whitespace run (newlines included) to one space and trim the ends
+    return ' '.join(text.split())
 
-def encode_image_to_base64(file_obj: BytesIO) -> str:
+def _sniff_image_mime_type(image_data: bytes, name: str) -> str:
     """
-    Encode an uploaded image file to base64.
+    Detect an image's MIME type from its magic bytes, falling back to the file name.
 
     Args:
-        file_obj (BytesIO): The uploaded image file.
+        image_data (bytes): The image content (any bytes-like object).
+        name (str): The image file name.
 
     Returns:
-        str: The base64-encoded string.
+        str: The MIME type.
+    """
+    header = bytes(image_data[:12])
+    if header[:3] == b'\xff\xd8\xff':
+        return "image/jpeg"
+    if header[:8] == b'\x89PNG\r\n\x1a\n':
+        return "image/png"
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return "image/webp"
+    mime_type, _ = mimetypes.guess_type(name)
+    return mime_type if mime_type and mime_type.startswith("image/") else "image/png"
+
+def _image_data_url(image_data: bytes, name: str) -> str:
+    """
+    Build a base64 data URL for an image.
+
+    Args:
+        image_data (bytes): The image content (any bytes-like object).
+        name (str): The image file name.
+
+    Returns:
+        str: The data URL.
+    """
+    base64_image = base64.b64encode(image_data).decode('ascii')
+    mime_type = _sniff_image_mime_type(image_data, name)
+    return f"data:{mime_type};base64,{base64_image}"
+
+def _is_retryable_ocr_error(error: SDKError) -> bool:
     """
-    image_data = file_obj.read()
-    return base64.b64encode(image_data).decode('utf-8')
+    Check whether a Mistral API error is transient (rate limited or overloaded).
+
+    Args:
+        error (SDKError): The API error.
 
-def extract_text_from_image(file_obj: BytesIO) -> str:
+    Returns:
+        bool: True if the request should be retried.
+    """
+    status_code = getattr(error, "status_code", None)
+    message = str(error).lower()
+    return status_code in (429, 503) or "rate limit" in message or "quota" in message
+
+class _RateLimiter:
+    """Space request starts at least 1 / requests_per_second seconds apart."""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self.lock:
+            now = time.monotonic()
+            if self.next_start > now:
+                await asyncio.sleep(self.next_start - now)
+            self.next_start = max(now, self.next_start) + self.interval
+
+async def _ocr_image_async(client: Mistral, image_url: str, semaphore: asyncio.Semaphore,
+                           rate_limiter: _RateLimiter) -> str:
     """
-    Extract markdown text from an image using Mistral OCR.
+    Extract markdown text from an image data URL, retrying transient errors with backoff.
 
     Args:
-        file_obj (BytesIO): The uploaded image file.
+        client (Mistral): The Mistral client.
+        image_url (str): The image data URL.
+        semaphore (asyncio.Semaphore): Bounds the number of in-flight requests.
+        rate_limiter (_RateLimiter): Spaces out request starts.
 
     Returns:
         str: The extracted markdown text.
     """
-    base64_image = encode_image_to_base64(file_obj)
-    mime_type = "image/jpeg" if file_obj.name.endswith('.jpg') else "image/png"
-    image_url = f"data:{mime_type};base64,{base64_image}"
+    for attempt in range(OCR_MAX_ATTEMPTS):
+        async with semaphore:
+            await rate_limiter.wait()
+            try:
+                ocr_response = await client.ocr.process_async(
+                    model=OCR_MODEL,
+                    document={
+                        "type": "image_url",
+                        "image_url": image_url
+                    }
+                )
+                return "".join(page.markdown + "\n\n" for page in ocr_response.pages)
+            except SDKError as e:
+                if attempt == OCR_MAX_ATTEMPTS - 1 or not _is_retryable_ocr_error(e):
+                    raise
+        # Back off with jitter outside the semaphore so other requests can proceed
+        delay = min(OCR_MAX_BACKOFF_SECONDS, OCR_BACKOFF_SECONDS * 2 ** attempt)
+        await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+def _get_ocr_limits() -> Tuple[asyncio.Semaphore, _RateLimiter]:
+    """
+    Get the process-wide OCR concurrency and rate limits, creating them on first use.
+
+    Only called from coroutines on the OCR event loop, so creation does not race.
+
+    Returns:
+        Tuple[asyncio.Semaphore, _RateLimiter]: The shared semaphore and rate limiter.
+    """
+    global _ocr_limits
+    if _ocr_limits is None:
+        _ocr_limits = (asyncio.Semaphore(OCR_MAX_CONCURRENCY), _RateLimiter(OCR_REQUESTS_PER_SECOND))
+    return _ocr_limits
+
+async def _ocr_images_async(client: Mistral, image_urls: List[str], on_result: Callable[[int, str], None]) -> None:
+    """
+    Run Mistral OCR on several images concurrently.
+
+    If any request fails, the requests still pending are cancelled before the
+    error is raised; results already received have been passed to on_result.
+
+    Args:
+        client (Mistral): The Mistral client.
+        image_urls (List[str]): The image data URLs.
+        on_result (Callable[[int, str], None]): Called with the index and extracted
+            markdown text of each image as it completes.
+    """
+    semaphore, rate_limiter = _get_ocr_limits()
+
+    async def ocr_image(index: int, image_url: str) -> None:
+        on_result(index, await _ocr_image_async(client, image_url, semaphore, rate_limiter))
+
+    tasks = [asyncio.ensure_future(ocr_image(index, image_url)) for index, image_url in enumerate(image_urls)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # gather leaves the other requests running, so stop them from calling the API
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+@st.cache_resource(show_spinner=False)
+def _get_mistral_client() -> Mistral:
+    """
+    Create the Mistral client once, reading the API key from Streamlit secrets.
+
+    Returns:
+        Mistral: The shared client, whose HTTP connection pools persist across reruns.
+    """
+    return Mistral(api_key=st.secrets.get("mistral_api_key", ""), timeout_ms=OCR_TIMEOUT_MS)
+
+@st.cache_resource(show_spinner=False)
+def _get_ocr_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Start the event loop that runs OCR requests on a background thread.
+
+    The client's async connection pool is bound to the loop it first runs on, so
+    keeping a single long-lived loop lets keep-alive connections be reused across batches.
+
+    Returns:
+        asyncio.AbstractEventLoop: The running event loop.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="ocr-event-loop", daemon=True).start()
+    return loop
+
+def _ocr_cache_key(image_url: str) -> bytes:
+    """
+    Build the OCR cache key for an image.
+
+    Args:
+        image_url (str): The image data URL (MIME type and base64 content).
+
+    Returns:
+        bytes: The BLAKE2b digest of the OCR model and image.
+    """
+    return hashlib.blake2b(f"{OCR_MODEL}\n{image_url}".encode('utf-8'), digest_size=16).digest()
+
+def _get_cached_ocr_text(key: bytes) -> Optional[str]:
+    """
+    Look up a cached OCR result, marking it as recently used.
+
+    Args:
+        key (bytes): The OCR cache key.
+
+    Returns:
+        Optional[str]: The cached text, or None if not cached.
+    """
+    with _ocr_cache_lock:
+        text = _ocr_cache.get(key)
+        if text is not None:
+            _ocr_cache.move_to_end(key)
+        return text
+
+def _cache_ocr_text(key: bytes, text: str) -> None:
+    """
+    Store an OCR result, evicting the least recently used entries beyond OCR_CACHE_SIZE.
+
+    Args:
+        key (bytes): The OCR cache key.
+        text (str): The cleaned OCR text.
+    """
+    with _ocr_cache_lock:
+        _ocr_cache[key] = text
+        _ocr_cache.move_to_end(key)
+        while len(_ocr_cache) > OCR_CACHE_SIZE:
+            _ocr_cache.popitem(last=False)
+
+def _ocr_data_urls(image_urls: List[str]) -> List[str]:
+    """
+    Run Mistral OCR on base64 image data URLs with bounded concurrency.
+
+    Images already OCR'd in this process are served from the cache without an API call.
+
+    Args:
+        image_urls (List[str]): The image data URLs.
+
+    Returns:
+        List[str]: The cleaned extracted text for each image, in order.
+    """
+    if not image_urls:
+        return []
+    keys = [_ocr_cache_key(image_url) for image_url in image_urls]
+    texts = [_get_cached_ocr_text(key) for key in keys]
+    missing = [i for i, text in enumerate(texts) if text is None]
+    if missing:
+        def store_result(index: int, markdown_text: str) -> None:
+            # Cached as each request completes, so a failed batch keeps the pages already paid for
+            i = missing[index]
+            texts[i] = clean_ocr_text(markdown_text)
+            _cache_ocr_text(keys[i], texts[i])
+
+        asyncio.run_coroutine_threadsafe(
+            _ocr_images_async(_get_mistral_client(), [image_urls[i] for i in missing], store_result),
+            _get_ocr_event_loop()
+        ).result()
+    return texts
+
+def extract_text_from_image(image_data: bytes, name: str) -> str:
+    """
+    Extract text from an image using Mistral OCR.
+
+    Args:
+        image_data (bytes): The image content (any bytes-like object).
+        name (str): The image file name.
+
+    Returns:
+        str: The cleaned extracted text.
+    """
+    return _ocr_data_urls([_image_data_url(image_data, name)])[0]
+
+def _ocr_page_images(images: List[bytes]) -> List[str]:
+    """
+    Run OCR on rendered PDF pages.
+
+    Args:
+        images (List[bytes]): The JPEG page renderings.
+
+    Returns:
+        List[str]: The extracted text for each page, in order.
+    """
+    # Renderings are always JPEG, so the data URLs are built directly from the bytes
+    return _ocr_data_urls([
+        f"data:image/jpeg;base64,{base64.b64encode(image).decode('ascii')}" for image in images
+    ])
+
+def extract_text_from_pdf(file_obj: BytesIO) -> str:
+    """
+    Extract text from a PDF, using OCR for low-confidence pages.
+
+    Pages are extracted inline (PyMuPDF takes milliseconds per page), and OCR
+    fallbacks are sent concurrently in one rate-limited batch; the output keeps
+    the original page order.
+
+    Args:
+        file_obj (BytesIO): The uploaded PDF file.
+
+    Returns:
+        str: The extracted text with page markers.
+    """
+    pdf_bytes = file_obj.getvalue()
+    pages = extract_pdf_pages(pdf_bytes)
+    num_pages = len(pages)
     
-    ocr_response = mistral_client.ocr.process(
-        model="mistral-ocr-latest",
-        document={
-            "type": "image_url",
-            "image_url": image_url
-        }
-    )
+    page_texts = {page_num: page_text for page_num, page_text, _ in pages}
+    ocr_pages = [(page_num, image) for page_num, _, image in pages if image is not None]
+    if ocr_pages:
+        ocr_texts = _ocr_page_images([image for _, image in ocr_pages])
+        for (page_num, _), page_text in zip(ocr_pages, ocr_texts):
+            page_texts[page_num] = page_text
+        
+        # Retry pages with little OCR text once at full resolution
+        retry_pages = [page_num for page_num, _ in ocr_pages
+                       if len((page_texts[page_num] or '').strip()) < OCR_RETRY_MIN_CHARS]
+        if retry_pages:
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf:
+                images = [render_page_for_ocr(pdf[page_num], OCR_MAX_DPI) for page_num in retry_pages]
+            for page_num, page_text in zip(retry_pages, _ocr_page_images(images)):
+                if len(page_text.strip()) > len((page_texts[page_num] or '').strip()):
+                    page_texts[page_num] = page_text
     
-    markdown_text = ""
-    for page in ocr_response.pages:
-        markdown_text += page.markdown + "\n\n"
-    return clean_ocr_text(markdown_text)
+    text = ''
+    for page_num in range(num_pages):
+        page_text = page_texts[page_num]
+        if page_text:
+            page_text = clean_ocr_text(page_text)
+            text += f"\n[Page {page_num + 1}]\n{page_text}"
+        else:
+            text += f"\n[Page {page_num + 1}] - Unable to extract text"
+    return text.strip()
 
-def extract_text_from_file(file_obj: BytesIO) -> Optional[str]:
+@st.cache_data(show_spinner=False, max_entries=64)
+def _extract_text_from_bytes(data: bytes, name: str) -> Optional[str]:
     """
-    Extract text from a file, using OCR for images and low-confidence PDFs.
+    Extract text from a file's content, cached on the content and file name so
+    reruns with the same upload skip parsing and OCR.
 
     Args:
-        file_obj (BytesIO): The uploaded file.
+        data (bytes): The file content.
+        name (str): The file name, which selects the extraction method.
 
     Returns:
-        Optional[str]: The extracted text, or None if extraction fails.
+        Optional[str]: The extracted text, or None if the file type is unsupported.
     """
+    file_obj = BytesIO(data)
+    file_obj.name = name
     try:
-        if file_obj.name.endswith('.txt'):
-            text = file_obj.read().decode('utf-8', errors='replace')
-            return clean_ocr_text(text)
+        if name.endswith('.txt'):
+            return clean_ocr_text(data.decode('utf-8', errors='replace'))
         
-        elif file_obj.name.endswith('.docx'):
+        elif name.endswith('.docx'):
             text = docx2txt.process(file_obj)
             text = re.sub(r'\n{2,}', '\n', text)
             return clean_ocr_text(text)
         
-        elif file_obj.name.endswith('.pdf'):
-            text = ''
-            with pdfplumber.open(file_obj) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    page_text = page.extract_text(layout=True)
-                    # Check if text extraction is low-confidence (e.g., empty or too short)
-                    if not page_text or len(page_text.strip()) < 10:
-                        # Fallback to OCR for this page
-                        file_obj.seek(0)  # Reset file pointer
-                        page_image = page.to_image(resolution=300).original
-                        buffer = BytesIO()
-                        page_image.save(buffer, format="PNG")
-                        buffer.name = "temp.png"
-                        buffer.seek(0)
-                        page_text = extract_text_from_image(buffer)
-                    if page_text:
-                        page_text = clean_ocr_text(page_text)
-                        text += f"\n[Page {page_num + 1}]\n{page_text}"
-                    else:
-                        text += f"\n[Page {page_num + 1}] - Unable to extract text"
-            return text.strip()
+        elif name.endswith('.pdf'):
+            return extract_text_from_pdf(file_obj)
         
-        elif file_obj.name.endswith(('.jpg', '.png')):
-            return extract_text_from_image(file_obj)
+        elif name.endswith(('.jpg', '.png')):
+            # Encode the cached bytes directly; a new BytesIO would copy them on getbuffer()
+            return extract_text_from_image(data, name)
         
         else:
             return None
     
     except Exception as e:
-        raise Exception(f"Error extracting text from {file_obj.name}: {str(e)}")
+        raise Exception(f"Error extracting text from {name}: {str(e)}")
+
+def extract_text_from_file(file_obj: BytesIO) -> Optional[str]:
+    """
+    Extract text from a file, using OCR for images and low-confidence PDFs.
+
+    Args:
+        file_obj (BytesIO): The uploaded file.
+
+    Returns:
+        Optional[str]: The extracted text, or None if extraction fails.
+    """
+    return _extract_text_from_bytes(file_obj.getvalue(), file_obj.name)
+
+def _parse_markdown(markdown_text: str) -> Tuple[List[List[str]], List[str]]:
+    """
+    Split markdown into its first table's rows and the remaining text lines in a single pass.
+
+    Args:
+        markdown_text (str): The markdown text to parse.
+
+    Returns:
+        Tuple[List[List[str]], List[str]]: The table rows (without the separator row) and
+        the stripped, non-empty lines that are not table rows.
+    """
+    table_data = []
+    other_lines = []
+    table_done = False
+    
+    for line in markdown_text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('|') and stripped.endswith('|'):
+            if not table_done and not stripped.startswith('| ---'):
+                table_data.append([cell.strip() for cell in stripped.split('|')[1:-1]])
+        elif table_data:  # The first non-table line ends the table
+            table_done = True
+        if stripped and not line.startswith('|'):
+            other_lines.append(stripped)
+    
+    return table_data, other_lines
 
 def markdown_to_table_data(markdown_text: str) -> List[List[str]]:
     """
@@ -171,17 +520,7 @@ def markdown_to_table_data(markdown_text: str) -> List[List[str]]:
     Returns:
         List[List[str]]: The parsed table data as a list of rows.
     """
-    lines = markdown_text.split('\n')
-    table_data = []
-    
-    for line in lines:
-        if line.strip().startswith('|') and line.strip().endswith('|') and not line.strip().startswith('| ---'):
-            cells = [cell.strip() for cell in line.split('|')[1:-1]]
-            table_data.append(cells)
-        elif table_data:  # If we've already started parsing a table, stop at the first non-table line
-            break
-    
-    return table_data
+    return _parse_markdown(markdown_text)[0]
 
 def markdown_to_docx(markdown_text: str) -> BytesIO:
     """
@@ -194,19 +533,20 @@ def markdown_to_docx(markdown_text: str) -> BytesIO:
         BytesIO: The generated docx file as a BytesIO object.
     """
     doc = DocxDocument()
-    table_data = markdown_to_table_data(markdown_text)
+    table_data, other_lines = _parse_markdown(markdown_text)
     
     if table_data:
-        table = doc.add_table(rows=len(table_data), cols=len(table_data[0]))
+        num_cols = len(table_data[0])
+        table = doc.add_table(rows=len(table_data), cols=num_cols)
         table.style = 'Table Grid'
+        # Table.cell() rebuilds the full cell list on every call; fetch it once instead
+        cells = table._cells
         for i, row in enumerate(table_data):
-            for j, cell in enumerate(row):
-                table.cell(i, j).text = cell
+            for j, cell in enumerate(row[:num_cols]):
+                cells[i * num_cols + j].text = cell
     
-    remaining_text = '\n'.join(line for line in markdown_text.split('\n') if not line.startswith('|'))
-    for line in remaining_text.split('\n'):
-        if line.strip():
-            doc.add_paragraph(line.strip())
+    for line in other_lines:
+        doc.add_paragraph(line)
     
     buffer = BytesIO()
     doc.save(buffer)
@@ -225,36 +565,37 @@ def markdown_to_pdf(markdown_text: str) -> BytesIO:
     """
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
     story = []
     
-    table_data = markdown_to_table_data(markdown_text)
+    table_data, other_lines = _parse_markdown(markdown_text)
     if table_data:
         table = Table(table_data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        table.setStyle(_PDF_TABLE_STYLE)
         story.append(table)
     
-    remaining_text = '\n'.join(line for line in markdown_text.split('\n') if not line.startswith('|'))
-    for line in remaining_text.split('\n'):
-        if line.strip():
-            story.append(Paragraph(line.strip(), styles['Normal']))
+    for line in other_lines:
+        story.append(Paragraph(line, _PDF_STYLES['Normal']))
     
     doc.build(story)
     buffer.seek(0)
     return buffer
 
+@functools.lru_cache(maxsize=4)
+def _get_font(size: int = 14) -> ImageFont.ImageFont:
+    """
+    Load the font used for image rendering, falling back to Pillow's default.
+
+    Args:
+        size (int): The font size.
+
+    Returns:
+        ImageFont.ImageFont: The loaded font, shared across calls.
+    """
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
 def markdown_to_image(markdown_text: str) -> BytesIO:
     """
     Convert markdown text with tables to an image.
@@ -265,36 +606,42 @@ def markdown_to_image(markdown_text: str) -> BytesIO:
     Returns:
         BytesIO: The generated image file as a BytesIO object.
     """
-    table_data = markdown_to_table_data(markdown_text)
+    table_data, other_lines = _parse_markdown(markdown_text)
     num_rows = len(table_data) if table_data else 0
     num_cols = len(table_data[0]) if table_data and table_data[0] else 0
-    cell_width = 150
     cell_height = 30
-    width = max(num_cols * cell_width, 600)
-    height = max(num_rows * cell_height + (len(markdown_text.split('\n')) - num_rows) * 20 + 50, 400)
+    font = _get_font()
+    # Size each column to its widest cell, plus padding, instead of a fixed width
+    col_widths = [
+        int(max(font.getlength(row[j]) if j < len(row) else 0 for row in table_data)) + 10
+        for j in range(num_cols)
+    ]
+    col_lefts = [10]
+    for col_width in col_widths:
+        col_lefts.append(col_lefts[-1] + col_width)
+    width = max(col_lefts[-1] + 10, 600)
+    height = max(num_rows * cell_height + len(other_lines) * 20 + 50, 400)
     
     img = Image.new('RGB', (width, height), color='white')
     draw = ImageDraw.Draw(img)
-    try:
-        font = ImageFont.truetype("arial.ttf", 14)
-    except:
-        font = ImageFont.load_default()
     
     y = 10
     if table_data:
-        for i, row in enumerate(table_data):
-            x = 10
-            for j, cell in enumerate(row):
-                draw.rectangle([x, y, x + cell_width, y + cell_height], outline='black')
+        # Draw the grid as one line per row/column boundary rather than a rectangle per cell
+        grid_right = col_lefts[-1]
+        grid_bottom = y + num_rows * cell_height
+        for row_y in range(y, grid_bottom + 1, cell_height):
+            draw.line([(10, row_y), (grid_right, row_y)], fill='black')
+        for col_x in col_lefts:
+            draw.line([(col_x, y), (col_x, grid_bottom)], fill='black')
+        for row in table_data:
+            for x, cell in zip(col_lefts, row):
                 draw.text((x + 5, y + 5), cell, font=font, fill='black')
-                x += cell_width
             y += cell_height
     
-    remaining_text = '\n'.join(line for line in markdown_text.split('\n') if not line.startswith('|'))
-    for line in remaining_text.split('\n'):
-        if line.strip():
-            draw.text((10, y), line.strip(), font=font, fill='black')
-            y += 20
+    for line in other_lines:
+        draw.text((10, y), line, font=font, fill='black')
+        y += 20
     
     buffer = BytesIO()
     img.save(buffer, format="PNG")
@@ -323,6 +670,33 @@ def convert_to_original_format(redacted_text: str, original_filename: str) -> By
         return markdown_to_image(redacted_text)
     return BytesIO(redacted_text.encode('utf-8'))
 
+def redact_files_batch(file_objs: List[BytesIO], model: any, labels: List[str], threshold: float) -> List[Tuple[Optional[str], Optional[str], List[Dict[str, any]]]]:
+    """
+    Redact several files, running entity prediction on all of their text in shared batches.
+
+    Args:
+        file_objs (List[BytesIO]): The uploaded files.
+        model (any): The model for entity prediction.
+        labels (List[str]): The labels to detect.
+        threshold (float): The confidence threshold for entity detection.
+
+    Returns:
+        List[Tuple[Optional[str], Optional[str], List[Dict[str, any]]]]: The original text,
+        redacted text, and detected entities for each file, in order.
+    """
+    # Extracted on the script thread, where Streamlit's caches and secrets are available;
+    # OCR requests within each file are still sent concurrently
+    original_texts = [extract_text_from_file(file_obj) for file_obj in file_objs]
+    
+    extracted = [i for i, original_text in enumerate(original_texts) if original_text]
+    predictions = predict_documents(model, [original_texts[i] for i in extracted], labels, threshold)
+    results = [(None, None, []) for _ in file_objs]
+    for i, entities in zip(extracted, predictions):
+        # Files without detected entities need no rewrite pass
+        redacted_text = redact_text(original_texts[i], entities) if entities else original_texts[i]
+        results[i] = (original_texts[i], redacted_text, entities)
+    return results
+
 def redact_file_content(file_obj: BytesIO, model: any, labels: List[str], threshold: float) -> Tuple[Optional[str], Optional[str], List[Dict[str, any]]]:
     """
     Redact file content and return both original and redacted versions.
@@ -336,9 +710,4 @@ def redact_file_content(file_obj: BytesIO, model: any, labels: List[str], thresh
     Returns:
         Tuple[Optional[str], Optional[str], List[Dict[str, any]]]: The original text, redacted text, and detected entities.
     """
-    original_text = extract_text_from_file(file_obj)
-    if original_text:
-        entities = model.predict_entities(original_text, labels, threshold=threshold)
-        redacted_text = redact_text(original_text, entities)
-        return original_text, redacted_text, entities
-    return None, None, []
+    return redact_files_batch([file_obj], model, labels, threshold)[0]